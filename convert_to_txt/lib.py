@@ -8,14 +8,19 @@ Ref.:
 - https://github.com/na--/ebook-tools/blob/master/lib.sh
 """
 import ast
+import codecs
+import collections
+import concurrent.futures
+import functools
+import io
 import logging
 import mimetypes
 import os
 import re
-import shlex
 import shutil
 import subprocess
 import tempfile
+import threading
 from pathlib import Path
 
 from convert_to_txt import __version__
@@ -25,6 +30,46 @@ from convert_to_txt import __version__
 logger = logging.getLogger('convert_lib')
 logger.setLevel(logging.CRITICAL + 1)
 
+# Load the mime types map once instead of on the first guess
+mimetypes.init()
+# Magic numbers (i.e. first bytes of a file) of the supported documents
+_MAGIC_NUMBERS = [
+    (b'%PDF', 'application/pdf'),
+    (b'AT&TFORM', 'image/vnd.djvu'),
+]
+# Magic number of the OLE2 files. They are not necessarily doc files (e.g. xls,
+# ppt or msi) thus the file's extension is also checked
+_OLE_MAGIC_NUMBER = b'\xd0\xcf\x11\xe0'
+# Shell outputs are only evaluated as Python literals if they start with one of
+# these characters and are shorter than the given length
+_LITERAL_START_CHARS = '[{("\''
+_LITERAL_MAX_LENGTH = 4096
+# Number of bytes read at the beginning of a document to find its mime type
+_SNIFF_SIZE = 4096
+# Size of the pipes' buffers and maximum number of bytes kept from a stderr
+_PIPE_BUFFER_SIZE = 16384
+# Page range from a page specification, e.g. '3' or '10-20' (spaces allowed)
+_PAGE_REGEX = re.compile(r'\s*(\d+)\s*(?:-\s*(\d+)\s*)?')
+# Number of characters read at once when scanning a text file
+_CHUNK_SIZE = 65536
+# Any (unicode) alphanumeric character, i.e. a word character except '_'
+_ALNUM_REGEX = re.compile(r'[^\W_]')
+# Number of CPUs this process can actually run on (e.g. in a container or with
+# taskset). sched_getaffinity() isn't available on all platforms (e.g. macOS)
+if hasattr(os, 'sched_getaffinity'):
+    _DEFAULT_WORKERS = len(os.sched_getaffinity(0))
+else:
+    _DEFAULT_WORKERS = os.cpu_count() or 1
+_LOGGING_FORMATTERS = {
+    'console': '%(name)-10s | %(levelname)-8s | %(message)s',
+    # 'console': '%(asctime)s | %(levelname)-8s | %(message)s',
+    'only_msg': '%(message)s',
+    'simple': '%(levelname)-8s %(message)s',
+    'verbose': '%(asctime)s | %(name)-10s | %(levelname)-8s | %(message)s'
+}
+# Arguments of the last call to setup_log() (None if it wasn't called)
+_LOG_SETTINGS = None
+
 
 # =====================
 # Default config values
@@ -33,21 +78,28 @@ logger.setLevel(logging.CRITICAL + 1)
 # convert_to_txt options
 # ======================
 CONVERT_PAGES = None
+PAGE_WORKERS = None
 DJVU_CONVERT_METHOD = 'djvutxt'
 EPUB_CONVERT_METHOD = 'ebook-convert'
 MSWORD_CONVERT_METHOD = 'textutil'
 PDF_CONVERT_METHOD = 'pdftotext'
 
+# convert_many options
+# ====================
+WORKERS = None
+
 # Logging options
 # ===============
 LOGGING_FORMATTER = 'only_msg'
 LOGGING_LEVEL = 'info'
 
 
+# The stdout and stderr can be given as raw bytes, in which case they are only
+# decoded when first accessed
 class Result:
     def __init__(self, stdout='', stderr='', returncode=None, args=None):
-        self.stdout = stdout
-        self.stderr = stderr
+        self._stdout = stdout
+        self._stderr = stderr
         self.returncode = returncode
         self.args = args
 
@@ -59,6 +111,26 @@ class Result:
                f'stderr={str(self.stderr).strip()}, ' \
                f'returncode={self.returncode}, args={self.args}'
 
+    @property
+    def stdout(self):
+        if isinstance(self._stdout, bytes):
+            self._stdout = _decode_shell_output(self._stdout)
+        return self._stdout
+
+    @stdout.setter
+    def stdout(self, value):
+        self._stdout = value
+
+    @property
+    def stderr(self):
+        if isinstance(self._stderr, bytes):
+            self._stderr = _decode_shell_output(self._stderr)
+        return self._stderr
+
+    @stderr.setter
+    def stderr(self, value):
+        self._stderr = value
+
 
 # ------
 # Colors
@@ -80,120 +152,134 @@ _COLOR_TO_CODE = {
     'v': COLORS['VIOLET'],
     'bold': COLORS['BOLD']
 }
+# Colors are also accepted in uppercase
+_COLOR_TO_CODE.update({k.upper(): v for k, v in _COLOR_TO_CODE.items()})
+_NC = COLORS['NC']
 
 
 def color(msg, msg_color='y', bold_msg=False):
-    msg_color = msg_color.lower()
-    colors = list(_COLOR_TO_CODE.keys())
-    assert msg_color in colors, f'Wrong color: {msg_color}. Only these ' \
-                                f'colors are supported: {msg_color}'
+    assert msg_color in _COLOR_TO_CODE, f'Wrong color: {msg_color}. Only these ' \
+                                        f'colors are supported: {list(_COLOR_TO_CODE)}'
+    code = _COLOR_TO_CODE[msg_color]
     msg = bold(msg) if bold_msg else msg
-    msg = msg.replace(COLORS['NC'], COLORS['NC']+_COLOR_TO_CODE[msg_color])
-    return f"{_COLOR_TO_CODE[msg_color]}{msg}{COLORS['NC']}"
+    # Restore the color after any nested colored text
+    if _NC in msg:
+        msg = msg.replace(_NC, _NC + code)
+    return f"{code}{msg}{_NC}"
 
 
+@functools.lru_cache(maxsize=1024)
 def blue(msg):
     return color(msg, 'b')
 
 
+@functools.lru_cache(maxsize=1024)
 def bold(msg):
     return color(msg, 'bold')
 
 
+@functools.lru_cache(maxsize=1024)
 def green(msg):
     return color(msg, 'g')
 
 
+@functools.lru_cache(maxsize=1024)
 def red(msg):
     return color(msg, 'r')
 
 
+@functools.lru_cache(maxsize=1024)
 def violet(msg):
     return color(msg, 'v')
 
 
+@functools.lru_cache(maxsize=1024)
 def yellow(msg):
     return color(msg)
 
 
 def catdoc(input_file, output_file):
-    cmd = f'catdoc "{input_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    args = ['catdoc', str(input_file)]
     # Everything on the stdout must be copied to the output file
-    if result.returncode == 0:
-        with open(output_file, 'w') as f:
-            f.write(result.stdout)
+    result = _run_streaming(args, output_file)
     return convert_result_from_shell_cmd(result)
 
 
 # Ref.: https://stackoverflow.com/a/28909933
+@functools.lru_cache(maxsize=32)
 def command_exists(cmd):
     return shutil.which(cmd) is not None
 
 
-def convert_result_from_shell_cmd(old_result):
-    new_result = Result()
+# The conversion tools are only looked for once in the PATH
+_AVAILABLE_TOOLS = {tool: command_exists(tool)
+                    for tool in ['catdoc', 'djvutxt', 'ebook-convert', 'pdftotext',
+                                 'textutil', 'unzip']}
+
 
-    for attr_name, new_val in new_result.__dict__.items():
+# The stdout and stderr are kept as they are (e.g. bytes) and are only decoded
+# if they are accessed
+def convert_result_from_shell_cmd(old_result):
+    new_result = Result(returncode=old_result.returncode, args=old_result.args)
+    for attr_name in ['stdout', 'stderr']:
         old_val = getattr(old_result, attr_name)
         if old_val is None:
             shell_args = getattr(old_result, 'args', None)
             # logger.debug(f'result.{attr_name} is None. Shell args: {shell_args}')
         else:
-            if isinstance(new_val, str):
-                try:
-                    new_val = old_val.decode('UTF-8')
-                except (AttributeError, UnicodeDecodeError) as e:
-                    if type(e) == UnicodeDecodeError:
-                        # old_val = b'...'
-                        new_val = old_val.decode('unicode_escape')
-                    else:
-                        # `old_val` already a string
-                        # logger.debug('Error decoding old value: {}'.format(old_val))
-                        # logger.debug(e.__repr__())
-                        # logger.debug('Value already a string. No decoding necessary')
-                        new_val = old_val
-                try:
-                    new_val = ast.literal_eval(new_val)
-                except (SyntaxError, ValueError) as e:
-                    # NOTE: ValueError might happen if value consists of [A-Za-z]
-                    # logger.debug('Error evaluating the value: {}'.format(old_val))
-                    # logger.debug(e.__repr__())
-                    # logger.debug('Aborting evaluation of string. Will consider
-                    # the string as it is')
-                    pass
-            else:
-                new_val = old_val
-        setattr(new_result, attr_name, new_val)
+            setattr(new_result, attr_name, old_val)
     return new_result
 
 
+def _decode_shell_output(value):
+    # Empty output: nothing to decode or evaluate
+    if not value:
+        return ''
+    try:
+        value = value.decode('UTF-8')
+    except UnicodeDecodeError:
+        value = value.decode('unicode_escape')
+    # Only evaluate short values that look like a Python literal, e.g. the
+    # text of a converted document doesn't need to be parsed
+    if value[:1] in _LITERAL_START_CHARS and len(value) < _LITERAL_MAX_LENGTH:
+        try:
+            value = ast.literal_eval(value)
+        except Exception:
+            # NOTE: e.g. ValueError might happen if value consists of [A-Za-z] and
+            # TypeError if it is an invalid literal such as {[1]: 2}
+            # logger.debug('Error evaluating the value: {}'.format(value))
+            # logger.debug('Aborting evaluation of string. Will consider
+            # the string as it is')
+            pass
+    return value
+
+
 def convert(input_file, output_file=None,
             convert_pages=CONVERT_PAGES,
             djvu_convert_method=DJVU_CONVERT_METHOD,
             epub_convert_method=EPUB_CONVERT_METHOD,
             msword_convert_method=MSWORD_CONVERT_METHOD,
             pdf_convert_method=PDF_CONVERT_METHOD,
+            page_workers=PAGE_WORKERS,
             **kwargs):
-    func_params = locals().copy()
     file_hash = None
-    mime_type = get_mime_type(input_file)
+    # Unknown files are left to ebook-convert
+    mime_type = get_mime_type_sniff(input_file, n=_SNIFF_SIZE) or 'application/octet-stream'
     logger.debug(f'mime type: {mime_type}')
     if mime_type == 'text/plain':
         logger.warning(yellow('The file is already in .txt'))
         # Return text if no output file was specified
         if output_file is None:
-            with open(input_file, 'r') as f:
-                text = f.read()
-            return text
+            return Path(input_file).read_text(encoding='utf8', errors='ignore')
         else:
             return 0
     return_txt = False
     # Create temp output file if output file not specified by user
     if output_file is None:
         return_txt = True
-        output_file = tempfile.mkstemp(suffix='.txt')[1]
+        # Close the temp file's descriptor right away (only its path is needed)
+        fd, output_file = tempfile.mkstemp(suffix='.txt')
+        os.close(fd)
     else:
         output_file = Path(output_file)
         # Check first that the output text file is valid
@@ -207,10 +293,14 @@ def convert(input_file, output_file=None,
         else:
             # Create output text file
             touch(output_file)
-    func_params['mime_type'] = mime_type
-    func_params['output_file'] = output_file
     logger.info("Starting document conversion to txt...")
-    result = convert_to_txt(**func_params)
+    result = convert_to_txt(input_file=input_file, output_file=output_file,
+                            mime_type=mime_type, convert_pages=convert_pages,
+                            djvu_convert_method=djvu_convert_method,
+                            epub_convert_method=epub_convert_method,
+                            msword_convert_method=msword_convert_method,
+                            pdf_convert_method=pdf_convert_method,
+                            page_workers=page_workers, **kwargs)
     statuscode = result.returncode
     if statuscode == 0:
         logger.debug('Conversion terminated')
@@ -220,11 +310,14 @@ def convert(input_file, output_file=None,
         logger.debug("Converted text is valid!")
     else:
         logger.error(red("Conversion failed!"))
-        size = os.stat(output_file).st_size
-        if size == 0:
+        size = os.path.getsize(output_file)
+        if statuscode != 0 and result.stderr:
+            # e.g. invalid page specification
+            logger.error(red(str(result.stderr).strip()))
+        elif size == 0:
             logger.error(red('The converted file is empty'))
         else:
-            logger.error(red(f'The converted txt with size {os.stat(output_file).st_size} '
+            logger.error(red(f'The converted txt with size {size} '
                              'bytes does not seem to contain text'))
         # Only remove output file if it is a temp file (i.e. return_txt = True)
         if return_txt:
@@ -233,8 +326,7 @@ def convert(input_file, output_file=None,
     logger.info(blue("Conversion successful!"))
     # Only remove output file if it is a temp file (i.e. return_txt = True)
     if return_txt:
-        with open(output_file, 'r', encoding="utf8", errors='ignore') as f:
-            text = f.read()
+        text = Path(output_file).read_text(encoding='utf8', errors='ignore')
         assert text
         remove_file(output_file)
         return text
@@ -242,6 +334,91 @@ def convert(input_file, output_file=None,
         return 0
 
 
+def _convert_one(input_file, output_file, **kwargs):
+    try:
+        returncode = convert(input_file, output_file, **kwargs)
+        return Result(returncode=returncode, args=str(input_file))
+    except Exception as e:
+        return Result(stderr=str(e), returncode=1, args=str(input_file))
+
+
+# Each document is saved as {output_dir}/{stem}.txt, or as {output_dir}/{name}.txt
+# (e.g. book.pdf.txt) if several documents share the same stem (e.g. book.pdf and
+# book.epub). Documents whose output file is one of the `protected_files` (e.g. a
+# text file given as input, which could also be the output of a previous run) are
+# skipped. Documents whose output file would overwrite another output file are
+# returned with an error result.
+def _get_output_files(input_files, output_dir, protected_files=()):
+    stems_count = collections.Counter(Path(f).stem for f in input_files)
+    protected_paths = {Path(f).resolve() for f in protected_files}
+    output_files = {}
+    existing = []
+    conflicts = []
+    for input_file in input_files:
+        input_path = Path(input_file)
+        if stems_count[input_path.stem] == 1:
+            output_file = Path(output_dir).joinpath(input_path.stem + '.txt')
+        else:
+            output_file = Path(output_dir).joinpath(input_path.name + '.txt')
+        if output_file.resolve() in protected_paths:
+            existing.append((input_file, output_file))
+        elif output_file in output_files.values():
+            msg = f'The output file would overwrite another output file: {output_file}'
+            conflicts.append(Result(stderr=msg, returncode=1, args=str(input_file)))
+        else:
+            output_files[input_file] = output_file
+    return output_files, existing, conflicts
+
+
+# Converts several documents in parallel. See _get_output_files() for where each
+# document is saved. Text files are not converted (nor copied).
+def convert_many(input_files, output_dir, workers=WORKERS, **kwargs):
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    workers = workers or _DEFAULT_WORKERS
+    # The documents are already converted in parallel: by default each one only
+    # converts its pages one at a time to avoid running too many processes
+    if kwargs.get('page_workers') is None:
+        kwargs['page_workers'] = 1
+    text_files = []
+    documents = []
+    for input_file in input_files:
+        if get_mime_type_sniff(input_file, n=_SNIFF_SIZE) == 'text/plain':
+            logger.debug(f'Skipped (already in .txt): {input_file}')
+            text_files.append(input_file)
+        else:
+            documents.append(input_file)
+    output_files, existing, results = _get_output_files(documents, output_dir, text_files)
+    for input_file, output_file in existing:
+        logger.warning(yellow(f'Skipped: {input_file}. The output file is one of the '
+                              f'input text files: {output_file}'))
+    for result in results:
+        logger.error(red(f'Skipped: {result.args}. {result.stderr}'))
+    logger.info(f'Converting {len(output_files)} documents with {workers} workers...')
+    # The worker processes don't necessarily inherit the logging config (e.g. with
+    # the 'spawn' start method, the default on macOS)
+    initializer = setup_log if _LOG_SETTINGS else None
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initializer,
+                                                initargs=_LOG_SETTINGS or ()) as executor:
+        futures = [executor.submit(_convert_one, input_file, output_file, **kwargs)
+                   for input_file, output_file in output_files.items()]
+        # Results are collected as they complete (not in submission order)
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            if result.returncode == 0:
+                logger.debug(f'Converted: {result.args}')
+            else:
+                msg = f'Failed: {result.args}'
+                logger.error(red(f'{msg}. {result.stderr}' if result.stderr else msg))
+            results.append(result)
+    n_failed = sum(1 for r in results if r.returncode != 0)
+    msg = f'Converted {len(results) - n_failed}/{len(results)} documents'
+    if n_failed:
+        logger.warning(yellow(f'{msg} ({n_failed} failed)'))
+    else:
+        logger.info(blue(msg))
+    return results
+
+
 # Tries to convert the supplied ebook file into .txt. It uses calibre's
 # ebook-convert tool. For optimization, if present, it will use pdftotext
 # for pdfs, catdoc for word files and djvutxt for djvu files.
@@ -251,67 +428,53 @@ def convert_to_txt(input_file, output_file, mime_type,
                    djvu_convert_method=DJVU_CONVERT_METHOD,
                    epub_convert_method=EPUB_CONVERT_METHOD,
                    msword_convert_method=MSWORD_CONVERT_METHOD,
-                   pdf_convert_method=PDF_CONVERT_METHOD, **kwargs):
+                   pdf_convert_method=PDF_CONVERT_METHOD,
+                   page_workers=PAGE_WORKERS, **kwargs):
     if mime_type.startswith('image/vnd.djvu') \
-         and djvu_convert_method == 'djvutxt' and command_exists('djvutxt'):
+         and djvu_convert_method == 'djvutxt' and _AVAILABLE_TOOLS['djvutxt']:
         logger.debug('The file looks like a djvu, using djvutxt to extract the text')
         result = djvutxt(input_file, output_file, pages=convert_pages)
     elif mime_type.startswith('application/epub+zip') \
-            and epub_convert_method == 'epubtxt' and command_exists('unzip'):
+            and epub_convert_method == 'epubtxt' and _AVAILABLE_TOOLS['unzip']:
         logger.debug('The file looks like an epub, using epubtxt to extract the text')
         result = epubtxt(input_file, output_file)
     elif mime_type == 'application/msword' \
             and msword_convert_method in ['catdoc', 'textutil'] \
-            and (command_exists('catdoc') or command_exists('textutil')):
+            and (_AVAILABLE_TOOLS['catdoc'] or _AVAILABLE_TOOLS['textutil']):
         msg = 'The file looks like a doc, using {} to extract the text'
-        if command_exists('catdoc'):
+        if _AVAILABLE_TOOLS['catdoc']:
             logger.debug(msg.format('catdoc'))
             result = catdoc(input_file, output_file)
         else:
             logger.debug(msg.format('textutil'))
             result = textutil(input_file, output_file)
     elif mime_type == 'application/pdf' and pdf_convert_method == 'pdftotext' \
-            and command_exists('pdftotext'):
+            and _AVAILABLE_TOOLS['pdftotext']:
         logger.debug('The file looks like a pdf, using pdftotext to extract the text')
         if convert_pages:
-            text = ''
+            text = io.StringIO()
             logger.debug(f'These are all the pages that need to be converted: {convert_pages}')
-            for p in convert_pages.split(','):
-                if '-' in p:
-                    p1, p2 = p.split('-')
-                    p1 = int(p1)
-                    p2 = int(p2)
-                    if p1 > p2:
-                        pages_to_process = sorted(range(p2, p1 + 1), reverse=True)
-                    else:
-                        pages_to_process = sorted(range(p1, p2 + 1))
-                else:
-                    pages_to_process = [int(p)]
-                logger.debug(f'Pages to process: {pages_to_process}')
-                for i, page_to_process in enumerate(pages_to_process, start=1):
-                    logger.debug(f'Processing page {i} of {len(pages_to_process)}')
-                    logger.debug(f'Page number: {page_to_process}')
-                    tmp_file_txt = tempfile.mkstemp(suffix='.txt')[1]
-                    logger.debug(f'Using tmp file {tmp_file_txt}')
-                    result = pdftotext(input_file, tmp_file_txt,
-                                       first_page_to_convert=page_to_process,
-                                       last_page_to_convert=page_to_process)
+            try:
+                page_ranges = _get_page_ranges(convert_pages)
+            except ValueError as e:
+                return convert_result_from_shell_cmd(Result(stderr=str(e), returncode=1))
+            page_workers = page_workers or _DEFAULT_WORKERS
+            logger.debug(f'Converting the pages with {page_workers} threads')
+            # Each page is converted by its own pdftotext process. map() returns
+            # the results in the same order as the pages
+            with concurrent.futures.ThreadPoolExecutor(max_workers=page_workers) as executor:
+                results = executor.map(functools.partial(_pdftotext_page, input_file),
+                                       _iter_pages(page_ranges))
+                for page_to_process, result in results:
                     if result.returncode == 0:
-                        logger.debug(f"Result of 'pdftotext':\n{result}")
-                        with open(tmp_file_txt, 'r') as f:
-                            data = f.read()
-                            # logger.debug(f"Text content of page {page_to_process}:\n{data}")
-                        text += data
+                        text.write(result.stdout.decode('UTF-8', errors='replace'))
                     else:
+                        result = convert_result_from_shell_cmd(result)
                         msg = red(f"Document couldn't be converted to txt: {result}")
                         logger.error(f'{msg}')
                         logger.error(f'Skipping current page ({page_to_process})')
-                    # Remove temporary file
-                    logger.debug('Cleaning up tmp file')
-                    remove_file(tmp_file_txt)
             logger.debug('Saving the text content')
-            with open(output_file, 'w') as f:
-                f.write(text)
+            Path(output_file).write_text(text.getvalue(), encoding='utf8')
             return convert_result_from_shell_cmd(Result(returncode=0))
         else:
             logger.debug('All pages from the pdf document will be converted to txt')
@@ -325,62 +488,139 @@ def convert_to_txt(input_file, output_file, mime_type,
     else:
         logger.debug(f"Trying to use calibre's ebook-convert to convert the {mime_type} file to .txt")
         result = ebook_convert(input_file, output_file)
-    logger.debug(f'Result from conversion: {result}')
+    # Lazy formatting: the result's output is only decoded if it is logged
+    logger.debug('Result from conversion: %s', result)
     return result
 
 
 def djvutxt(input_file, output_file, pages=None):
-    pages = f'--page={pages}' if pages else ''
-    cmd = f'djvutxt "{input_file}" "{output_file}" {pages}'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    args = ['djvutxt']
+    if pages:
+        args.append(f'--page={pages}')
+    args.extend([str(input_file), str(output_file)])
+    result = _run_streaming(args)
     return convert_result_from_shell_cmd(result)
 
 
 def ebook_convert(input_file, output_file):
-    cmd = f'ebook-convert "{input_file}" "{output_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    args = ['ebook-convert', str(input_file), str(output_file)]
+    result = _run_streaming(args)
     return convert_result_from_shell_cmd(result)
 
 
 def epubtxt(input_file, output_file):
-    cmd = f'unzip -c "{input_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if not result.stderr:
-        text = str(result.stdout)
-        with open(output_file, 'w') as f:
-            f.write(text)
-        result.stdout = text
+    args = ['unzip', '-c', str(input_file)]
+    result = _run_streaming(args, output_file)
     return convert_result_from_shell_cmd(result)
 
 
 # Using Python built-in module mimetypes
+@functools.lru_cache(maxsize=4096)
 def get_mime_type(file_path):
     return mimetypes.guess_type(file_path)[0]
 
 
+# Same as get_mime_type() but the first `n` bytes of the file are checked first
+# for a known magic number. A file without extension whose first bytes look like
+# text is considered as a plain text file.
+def get_mime_type_sniff(file_path, n=512):
+    try:
+        with open(file_path, 'rb') as f:
+            head = f.read(n)
+    except OSError:
+        # e.g. missing file: the conversion tool will report the error
+        return get_mime_type(file_path)
+    # The epub's mimetype (if any) is found within the first 64 bytes
+    mime_type = _get_mime_type_from_magic(head[:64])
+    if mime_type is None and head.startswith(_OLE_MAGIC_NUMBER) \
+            and get_mime_type(file_path) in [None, 'application/msword']:
+        mime_type = 'application/msword'
+    if mime_type is None and not Path(file_path).suffix and _is_text(head):
+        mime_type = 'text/plain'
+    return mime_type or get_mime_type(file_path)
+
+
+@functools.lru_cache(maxsize=4096)
+def _get_mime_type_from_magic(magic):
+    for magic_number, mime_type in _MAGIC_NUMBERS:
+        if magic.startswith(magic_number):
+            return mime_type
+    if magic.startswith(b'PK\x03\x04') and b'mimetypeapplication/epub+zip' in magic:
+        return 'application/epub+zip'
+    return None
+
+
+def _is_text(data):
+    if b'\x00' in data:
+        return False
+    try:
+        # The data might end in the middle of a multi-byte character
+        codecs.getincrementaldecoder('UTF-8')().decode(data)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+# Returns the (first_page, last_page) of each page range from a page
+# specification, e.g. '1,3,6-4' gives (1, 1), (3, 3), (6, 4)
+def _get_page_ranges(pages):
+    page_ranges = []
+    for page_range in pages.split(','):
+        match = _PAGE_REGEX.fullmatch(page_range)
+        if not match:
+            raise ValueError(f"Invalid page range '{page_range}' in the page "
+                             f"specification '{pages}'")
+        first_page = int(match.group(1))
+        last_page = int(match.group(2) or first_page)
+        if first_page < 1 or last_page < 1:
+            raise ValueError(f"Invalid page range '{page_range}' in the page "
+                             f"specification '{pages}': pages start at 1")
+        page_ranges.append((first_page, last_page))
+    return page_ranges
+
+
+# Yields the page numbers from the page ranges returned by _get_page_ranges().
+# A range in reverse order gives its pages in reverse order.
+def _iter_pages(page_ranges):
+    for first_page, last_page in page_ranges:
+        if first_page <= last_page:
+            yield from range(first_page, last_page + 1)
+        else:
+            yield from range(first_page, last_page - 1, -1)
+
+
 def isalnum_in_file(file_path):
     with open(file_path, 'r', encoding="utf8", errors='ignore') as f:
-        isalnum = False
-        for line in f:
-            for ch in line:
-                if ch.isalnum():
-                    isalnum = True
-                    break
-            if isalnum:
-                break
-    return isalnum
-
-
-def pdftotext(input_file, output_file, first_page_to_convert=None, last_page_to_convert=None):
-    first_page = f'-f {first_page_to_convert}' if first_page_to_convert else ''
-    last_page = f'-l {last_page_to_convert}' if last_page_to_convert else ''
-    pages = f'{first_page} {last_page}'.strip()
-    cmd = f'pdftotext "{input_file}" "{output_file}" {pages}'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        while True:
+            chunk = f.read(_CHUNK_SIZE)
+            if not chunk:
+                return False
+            if _ALNUM_REGEX.search(chunk):
+                return True
+
+
+# Returns the raw (i.e. not decoded) result since the page's text is read
+# directly from pdftotext's stdout
+def _pdftotext_page(input_file, page):
+    logger.debug(f'Processing page number: {page}')
+    return page, _run_streaming(_pdftotext_args(input_file, None, page, page))
+
+
+def _pdftotext_args(input_file, output_file, first_page_to_convert, last_page_to_convert):
+    args = ['pdftotext']
+    if first_page_to_convert:
+        args.extend(['-f', str(first_page_to_convert)])
+    if last_page_to_convert:
+        args.extend(['-l', str(last_page_to_convert)])
+    args.extend([str(input_file), '-' if output_file is None else str(output_file)])
+    return args
+
+
+# If `output_file` is None, the text is written to stdout and is thus available
+# from the returned result's stdout
+def pdftotext(input_file, output_file=None, first_page_to_convert=None, last_page_to_convert=None):
+    args = _pdftotext_args(input_file, output_file, first_page_to_convert, last_page_to_convert)
+    result = _run_streaming(args)
     return convert_result_from_shell_cmd(result)
 
 
@@ -394,8 +634,40 @@ def remove_file(file_path):
         return 1
 
 
+# Runs the command and either saves its stdout directly to `output_file` (without
+# keeping it in memory) or returns it in full if no output file is given. The
+# stderr is logged as it comes and only its last bytes are kept.
+def _run_streaming(args, output_file=None):
+    stderr = bytearray()
+
+    def drain_stderr(pipe):
+        for line in iter(pipe.readline, b''):
+            logger.debug(line.decode('UTF-8', errors='replace').rstrip())
+            stderr.extend(line)
+            # Only keep the last bytes
+            del stderr[:-_PIPE_BUFFER_SIZE]
+
+    stdout_file = open(output_file, 'wb') if output_file else None
+    try:
+        with subprocess.Popen(args, stdout=stdout_file or subprocess.PIPE,
+                              stderr=subprocess.PIPE,
+                              bufsize=_PIPE_BUFFER_SIZE) as process:
+            thread = threading.Thread(target=drain_stderr, args=(process.stderr,))
+            thread.start()
+            stdout = b'' if stdout_file else process.stdout.read()
+            returncode = process.wait()
+            thread.join()
+    finally:
+        if stdout_file:
+            stdout_file.close()
+    return subprocess.CompletedProcess(args, returncode, stdout, bytes(stderr))
+
+
 def setup_log(quiet=False, verbose=False, logging_level=LOGGING_LEVEL,
               logging_formatter=LOGGING_FORMATTER):
+    global _LOG_SETTINGS
+    # Saved so that convert_many()'s worker processes use the same settings
+    _LOG_SETTINGS = (quiet, verbose, logging_level, logging_formatter)
     if not quiet:
         for logger_name in ['convert_script', 'convert_lib']:
             logger_ = logging.getLogger(logger_name)
@@ -404,19 +676,15 @@ def setup_log(quiet=False, verbose=False, logging_level=LOGGING_LEVEL,
             else:
                 logging_level = logging_level.upper()
                 logger_.setLevel(logging_level)
+            # Remove the handlers from a previous call so that log lines aren't
+            # duplicated
+            logger_.handlers.clear()
             # Create console handler and set level
             ch = logging.StreamHandler()
             ch.setLevel(logging.DEBUG)
             # Create formatter
             if logging_formatter:
-                formatters = {
-                    'console': '%(name)-10s | %(levelname)-8s | %(message)s',
-                    # 'console': '%(asctime)s | %(levelname)-8s | %(message)s',
-                    'only_msg': '%(message)s',
-                    'simple': '%(levelname)-8s %(message)s',
-                    'verbose': '%(asctime)s | %(name)-10s | %(levelname)-8s | %(message)s'
-                }
-                formatter = logging.Formatter(formatters[logging_formatter])
+                formatter = logging.Formatter(_LOGGING_FORMATTERS[logging_formatter])
                 # Add formatter to ch
                 ch.setFormatter(formatter)
             # Add ch to logger
@@ -431,9 +699,8 @@ def setup_log(quiet=False, verbose=False, logging_level=LOGGING_LEVEL,
 # macOS equivalent for catdoc
 # See https://stackoverflow.com/a/44003923/14664104
 def textutil(input_file, output_file):
-    cmd = f'textutil -convert txt "{input_file}" -output "{output_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    args = ['textutil', '-convert', 'txt', str(input_file), '-output', str(output_file)]
+    result = _run_streaming(args)
     return convert_result_from_shell_cmd(result)
 
 
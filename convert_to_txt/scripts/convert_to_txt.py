@@ -7,14 +7,15 @@ shell by `na--`.
 Ref.: https://github.com/na--/ebook-tools
 """
 import argparse
+import glob
 import logging
 import os
 
 from convert_to_txt import __version__
-from convert_to_txt.lib import (convert, setup_log, blue, green, red, yellow,
+from convert_to_txt.lib import (convert, convert_many, setup_log, blue, green, red, yellow,
                  LOGGING_FORMATTER, LOGGING_LEVEL, CONVERT_PAGES,
                  DJVU_CONVERT_METHOD, EPUB_CONVERT_METHOD, MSWORD_CONVERT_METHOD,
-                 PDF_CONVERT_METHOD)
+                 PDF_CONVERT_METHOD, PAGE_WORKERS, WORKERS)
 
 # import ipdb
 
@@ -28,6 +29,7 @@ logger = logging.getLogger('convert_script')
 # ============
 QUIET = False
 OUTPUT_FILE = 'output.txt'
+OUTPUT_DIR = '.'
 
 
 class ArgumentParser(argparse.ArgumentParser):
@@ -157,6 +159,10 @@ def get_default_message(default_value):
     return green(f' (default: {default_value})')
 
 
+def has_glob_pattern(path):
+    return any(c in path for c in '*?[')
+
+
 def init_list(list_):
     return [] if list_ is None else list_
 
@@ -167,6 +173,16 @@ def print_(msg):
         print(msg)
 
 
+def positive_int(value):
+    try:
+        value_ = int(value)
+    except ValueError:
+        value_ = 0
+    if value_ < 1:
+        raise argparse.ArgumentTypeError(f"invalid positive int value: '{value}'")
+    return value_
+
+
 # Ref.: https://stackoverflow.com/a/4195302/14664104
 def required_length(nmin, nmax, is_list=True):
     class RequiredLength(argparse.Action):
@@ -239,6 +255,19 @@ def setup_argparser():
         choices=['pdftotext', 'ebook-convert'], default=PDF_CONVERT_METHOD,
         help='Set the conversion method for pdf documents.'
              + get_default_message(PDF_CONVERT_METHOD))
+    convert_group.add_argument(
+        '-j', '--jobs', dest='workers', metavar='N', type=positive_int,
+        default=WORKERS,
+        help='Number of documents converted in parallel when the input is a '
+             'directory or a glob pattern.'
+             + get_default_message('number of usable CPUs'))
+    convert_group.add_argument(
+        '--page-workers', dest='page_workers', metavar='N', type=positive_int,
+        default=PAGE_WORKERS,
+        help='Number of pages converted in parallel when using pdftotext with '
+             'the option -p.'
+             + get_default_message('number of usable CPUs, or 1 with a directory '
+                                   'or a glob pattern'))
     # ==================
     # Input/output files
     # ==================
@@ -246,11 +275,14 @@ def setup_argparser():
         title=yellow('Input/Output files'))
     input_output_files_group.add_argument(
         'input',
-        help='Path of the file (pdf, djvu, epub, word) that will be converted to txt.')
+        help='Path of the file (pdf, djvu, epub, word) that will be converted to txt. '
+             'It can also be a directory or a glob pattern, in which case all '
+             'the matching files are converted.')
     input_output_files_group.add_argument(
         'output', default=OUTPUT_FILE, nargs='*', action=required_length(0, 1),
-        help='Path of the output txt file.'
-             + get_default_message(OUTPUT_FILE))
+        help='Path of the output txt file. If the input is a directory or a glob '
+             'pattern, path of the directory where the txt files will be saved.'
+             + get_default_message(f'{OUTPUT_FILE} or {OUTPUT_DIR}'))
     return parser
 
 
@@ -270,15 +302,31 @@ def main():
         QUIET = args.quiet
         setup_log(args.quiet, args.verbose, args.logging_level, args.logging_formatter)
         # Actions
-        if isinstance(args.output, list):
-            output = args.output[0]
-        else:
-            output = args.output
-        exit_code = convert(args.input, output, convert_pages=args.pages,
+        convert_kwargs = dict(
+            convert_pages=args.pages,
             djvu_convert_method=args.djvu_convert_method,
             epub_convert_method=args.epub_convert_method,
             msword_convert_method=args.msword_convert_method,
-            pdf_convert_method=args.pdf_convert_method)
+            pdf_convert_method=args.pdf_convert_method,
+            page_workers=args.page_workers)
+        if os.path.isdir(args.input) or has_glob_pattern(args.input):
+            # Batch mode: the output (if given) is a directory
+            output_dir = args.output[0] if isinstance(args.output, list) else OUTPUT_DIR
+            if os.path.isdir(args.input):
+                input_files = sorted(os.path.join(args.input, f)
+                                     for f in os.listdir(args.input))
+            else:
+                input_files = sorted(glob.glob(args.input))
+            input_files = [f for f in input_files if os.path.isfile(f)]
+            results = convert_many(input_files, output_dir, workers=args.workers,
+                                   **convert_kwargs)
+            exit_code = 1 if any(r.returncode != 0 for r in results) else 0
+        else:
+            if isinstance(args.output, list):
+                output = args.output[0]
+            else:
+                output = args.output
+            exit_code = convert(args.input, output, **convert_kwargs)
     except KeyboardInterrupt:
         print_(yellow('\nProgram stopped!'))
         exit_code = 2